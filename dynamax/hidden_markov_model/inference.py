@@ -8,7 +8,7 @@ from functools import partial
 from typing import Callable, Optional, Tuple, Union, NamedTuple
 from jaxtyping import Int, Float, Array
 
-from dynamax.types import Scalar, PRNGKey
+from dynamax.types import Scalar
 
 _get_params = lambda x, dim, t: x[t] if x.ndim == dim + 1 else x
 
@@ -91,6 +91,35 @@ def _condition_on(probs, ll):
     return new_probs, log_norm
 
 
+def _scale_likelihoods(log_likelihoods):
+    """Exponentiate the log likelihoods after subtracting the max at each time step.
+
+    This is done once for the whole sequence so that the filtering scans only need to
+    multiply by the scaled likelihoods, rather than re-stabilizing them at each step.
+
+    Args:
+        log_likelihoods(t, k): log likelihood for state k at time t
+
+    Returns:
+        likelihoods(t, k): scaled likelihood for state k at time t
+        ll_max(t): log of the scale factor removed at time t
+    """
+    ll_max = log_likelihoods.max(axis=1)
+    return jnp.exp(log_likelihoods - ll_max[:, None]), ll_max
+
+
+def _condition_on_scaled(probs, likelihoods):
+    """Condition on new emissions, given in the form of scaled likelihoods
+    (see :func:`_scale_likelihoods`) for each discrete state.
+
+    Returns:
+        probs(k): posterior for state k
+        log_norm: log normalizer, excluding the scale factor
+    """
+    new_probs, norm = _normalize(probs * likelihoods)
+    return new_probs, jnp.log(norm)
+
+
 def _predict(probs, A):
     return A.T @ probs
 
@@ -121,14 +150,14 @@ def hmm_filter(
 
     """
     num_timesteps, num_states = log_likelihoods.shape
+    likelihoods, ll_max = _scale_likelihoods(log_likelihoods)
 
     def _step(carry, t):
         log_normalizer, predicted_probs = carry
 
         A = get_trans_mat(transition_matrix, transition_fn, t)
-        ll = log_likelihoods[t]
 
-        filtered_probs, log_norm = _condition_on(predicted_probs, ll)
+        filtered_probs, log_norm = _condition_on_scaled(predicted_probs, likelihoods[t])
         log_normalizer += log_norm
         predicted_probs_next = _predict(filtered_probs, A)
 
@@ -137,7 +166,8 @@ def hmm_filter(
     carry = (0.0, initial_distribution)
     (log_normalizer, _), (filtered_probs, predicted_probs) = lax.scan(_step, carry, jnp.arange(num_timesteps))
 
-    post = HMMPosteriorFiltered(marginal_loglik=log_normalizer,
+    # Add back the scale factors that were removed from the likelihoods.
+    post = HMMPosteriorFiltered(marginal_loglik=log_normalizer + ll_max.sum(),
                                 filtered_probs=filtered_probs,
                                 predicted_probs=predicted_probs)
     return post
@@ -169,15 +199,15 @@ def hmm_backward_filter(
 
     """
     num_timesteps, num_states = log_likelihoods.shape
+    likelihoods, ll_max = _scale_likelihoods(log_likelihoods)
 
     def _step(carry, t):
         log_normalizer, backward_pred_probs = carry
 
         A = get_trans_mat(transition_matrix, transition_fn, t)
-        ll = log_likelihoods[t]
 
-        # Condition on emission at time t, being careful not to overflow.
-        backward_filt_probs, log_norm = _condition_on(backward_pred_probs, ll)
+        # Condition on emission at time t, using the pre-scaled likelihoods to avoid overflow.
+        backward_filt_probs, log_norm = _condition_on_scaled(backward_pred_probs, likelihoods[t])
         # Update the log normalizer.
         log_normalizer += log_norm
         # Predict the next state (going backward in time).
@@ -187,7 +217,7 @@ def hmm_backward_filter(
     carry = (0.0, jnp.ones(num_states))
     (log_normalizer, _), rev_backward_pred_probs = lax.scan(_step, carry, jnp.arange(num_timesteps)[::-1])
     backward_pred_probs = rev_backward_pred_probs[::-1]
-    return log_normalizer, backward_pred_probs
+    return log_normalizer + ll_max.sum(), backward_pred_probs
 
 
 @partial(jit, static_argnames=["transition_fn"])
@@ -1,9 +1,10 @@
 from abc import abstractmethod, ABC
+from functools import partial
 from dynamax.ssm import SSM
 from dynamax.types import Scalar
 from dynamax.parameters import to_unconstrained, from_unconstrained
 from dynamax.parameters import ParameterSet, PropertySet
-from dynamax.hidden_markov_model.inference import HMMPosterior, HMMPosteriorFiltered
+from dynamax.hidden_markov_model.inference import HMMPosterior
 from dynamax.hidden_markov_model.inference import hmm_filter
 from dynamax.hidden_markov_model.inference import hmm_posterior_mode
 from dynamax.hidden_markov_model.inference import hmm_smoother
@@ -13,6 +14,7 @@ from dynamax.utils.utils import pytree_slice
 import jax.numpy as jnp
 import jax.random as jr
 from jax import vmap
+from jax.nn import log_softmax
 from jax.tree_util import tree_map
 from jaxtyping import Float, Array, PyTree
 import optax
@@ -97,7 +99,10 @@ class HMMInitialState(ABC):
         raise NotImplementedError
 
     def _compute_initial_probs(self, params, inputs=None):
-        return self.initial_distribution(params, inputs).probs_parameter()
+        return self.distribution(params, inputs).probs_parameter()
+
+    def _compute_log_initial_probs(self, params, inputs=None):
+        return log_softmax(self.distribution(params, inputs).logits_parameter())
 
     def collect_suff_stats(self,
                            params: ParameterSet,
@@ -117,6 +122,22 @@ class HMMInitialState(ABC):
         """
         return posterior.smoothed_probs[0], pytree_slice(inputs, 0)
 
+    def reduce_suff_stats(self, batch_stats: PyTree) -> PyTree:
+        """Reduce the batch of sufficient statistics before the M-step (see :meth:`HMM._batch_e_step`)."""
+        return batch_stats
+
+    def _expected_log_likelihood(self, params, batch_stats):
+        # Sum the expected log probabilities of the initial states over sequences.
+        expected_initial_states, inputs = batch_stats
+        if inputs is None:
+            # The initial probabilities are shared by all sequences, so compute them once
+            # and contract them with the expected initial counts summed over the batch.
+            log_initial_probs = self._compute_log_initial_probs(params)
+            return jnp.sum(expected_initial_states.sum(axis=0) * log_initial_probs)
+
+        batch_log_initial_probs = vmap(partial(self._compute_log_initial_probs, params))(inputs)
+        return jnp.sum(expected_initial_states * batch_log_initial_probs)
+
     def initialize_m_step_state(self,
                                 params: ParameterSet,
                                 props: PropertySet):
@@ -156,16 +177,7 @@ class HMMInitialState(ABC):
         # Minimize the negative expected log joint probability
         def neg_expected_log_joint(unc_params):
             params = from_unconstrained(unc_params, props)
-
-            def _single_expected_log_like(stats):
-                expected_initial_state, inpt = stats
-                log_initial_prob = jnp.log(self._compute_initial_probs(params, inpt))
-                lp = jnp.sum(expected_initial_state * log_initial_prob)
-                return lp
-
-            log_prior = self.log_prior(params)
-            batch_ells = vmap(_single_expected_log_like)(batch_stats)
-            expected_log_joint = log_prior + batch_ells.sum()
+            expected_log_joint = self.log_prior(params) + self._expected_log_likelihood(params, batch_stats)
             return -expected_log_joint / scale
 
         # Run gradient descent
@@ -238,18 +250,25 @@ class HMMTransitions(ABC):
         """
         raise NotImplementedError
 
-    def _compute_transition_matrices(self, params, inputs=None):
+    def _map_over_states(self, fn, params, inputs=None):
+        # Apply fn to the transition distribution out of each state (and each time step, if there are inputs)
         if inputs is not None:
             f = lambda inpt: \
                 vmap(lambda state: \
-                    self.distribution(params, state, inpt).probs_parameter())(
+                    fn(self.distribution(params, state, inpt)))(
                         jnp.arange(self.num_states))
             next_inputs = tree_map(lambda x: x[1:], inputs)
             return vmap(f)(next_inputs)
         else:
-            g = vmap(lambda state: self.distribution(params, state).probs_parameter())
+            g = vmap(lambda state: fn(self.distribution(params, state)))
             return g(jnp.arange(self.num_states))
 
+    def _compute_transition_matrices(self, params, inputs=None):
+        return self._map_over_states(lambda dist: dist.probs_parameter(), params, inputs)
+
+    def _compute_log_transition_matrices(self, params, inputs=None):
+        return self._map_over_states(lambda dist: log_softmax(dist.logits_parameter()), params, inputs)
+
     def collect_suff_stats(self,
                            params: ParameterSet,
                            posterior: HMMPosterior,
@@ -266,7 +285,25 @@ class HMMTransitions(ABC):
             PyTree of sufficient statistics for updating the transition distribution
 
         """
-        return posterior.trans_probs, pytree_slice(inputs, slice(1, None))
+        # Keep all the inputs, since the transition matrices are computed from the
+        # inputs of the next time step (see :meth:`_compute_transition_matrices`).
+        return posterior.trans_probs, inputs
+
+    def reduce_suff_stats(self, batch_stats: PyTree) -> PyTree:
+        """Reduce the batch of sufficient statistics before the M-step (see :meth:`HMM._batch_e_step`)."""
+        return batch_stats
+
+    def _expected_log_likelihood(self, params, batch_stats):
+        # Sum the expected log probabilities of the transitions over time steps and sequences.
+        expected_transitions, inputs = batch_stats
+        if inputs is None:
+            # The transition matrix is shared by all sequences, so compute it once
+            # and contract it with the expected transition counts summed over the batch.
+            log_trans_matrices = self._compute_log_transition_matrices(params)
+            return jnp.sum(expected_transitions.sum(axis=0) * log_trans_matrices)
+
+        batch_log_trans_matrices = vmap(partial(self._compute_log_transition_matrices, params))(inputs)
+        return jnp.sum(expected_transitions * batch_log_trans_matrices)
 
     def initialize_m_step_state(self, params: ParameterSet, props:PropertySet) -> Any:
         """Initialize any required state for the M step.
@@ -303,16 +340,7 @@ class HMMTransitions(ABC):
         # Minimize the negative expected log joint probability
         def neg_expected_log_joint(unc_params):
             params = from_unconstrained(unc_params, props)
-
-            def _single_expected_log_like(stats):
-                expected_transitions, inputs = stats
-                log_trans_matrix = jnp.log(self._compute_transition_matrices(params, inputs))
-                lp = jnp.sum(expected_transitions * log_trans_matrix)
-                return lp
-
-            log_prior = self.log_prior(params)
-            batch_ells = vmap(_single_expected_log_like)(batch_stats)
-            expected_log_joint = log_prior + batch_ells.sum()
+            expected_log_joint = self.log_prior(params) + self._expected_log_likelihood(params, batch_stats)
             return -expected_log_joint / scale
 
         # Run gradient descent
@@ -330,12 +358,20 @@ class HMMTransitions(ABC):
 
 class HMMEmissions(ABC):
     """Abstract class for HMM emissions.
+
+    If `m_step_low_precision` is True, the gradient-based M-step contracts the
+    expected states with the emission log likelihoods in bfloat16, accumulating
+    the result in float32. This halves the memory traffic of the largest
+    intermediate on accelerators, at the cost of some precision in the loss.
+    The E-step and the sufficient statistics are always computed in full precision.
     """
     def __init__(self,
                  m_step_optimizer=optax.adam(1e-2),
-                 m_step_num_iters=50) -> None:
+                 m_step_num_iters=50,
+                 m_step_low_precision=False) -> None:
         self.m_step_optimizer = m_step_optimizer
         self.m_step_num_iters = m_step_num_iters
+        self.m_step_low_precision = m_step_low_precision
 
     @property
     @abstractmethod
@@ -394,8 +430,24 @@ class HMMEmissions(ABC):
         """
         raise NotImplementedError
 
+    def _batched_distribution(self, params) -> Optional[tfd.Distribution]:
+        """Return the emission distributions of all states as a single distribution
+        with `batch_shape == (num_states,)`, or `None` if this is not supported.
+
+        Subclasses whose emission distributions do not depend on the inputs can
+        override this to avoid the nested vmap in :meth:`_compute_conditional_logliks`.
+        """
+        return None
+
     def _compute_conditional_logliks(self, params, emissions, inputs=None):
-        # Compute the log probability for each time step by
+        # If possible, evaluate all states at once by broadcasting the
+        # emissions against a distribution with one batch entry per state.
+        if inputs is None:
+            dist = self._batched_distribution(params)
+            if dist is not None:
+                return dist.log_prob(jnp.expand_dims(emissions, 1))
+
+        # Otherwise, compute the log probability for each time step by
         # performing a nested vmap over emission time steps and states.
         f = lambda emission, inpt: \
             vmap(lambda state: self.distribution(params, state, inpt).log_prob(emission))(
@@ -422,6 +474,24 @@ class HMMEmissions(ABC):
         """
         return posterior.smoothed_probs, emissions, inputs
 
+    def reduce_suff_stats(self, batch_stats: PyTree) -> PyTree:
+        """Reduce the batch of sufficient statistics before the M-step (see :meth:`HMM._batch_e_step`)."""
+        return batch_stats
+
+    def _expected_log_likelihood(self, params, batch_stats):
+        # Sum the expected emission log likelihoods over time steps, states, and sequences.
+        def _single_expected_log_like(stats):
+            expected_states, emissions, inputs = stats
+            log_likelihoods = self._compute_conditional_logliks(params, emissions, inputs)
+            if self.m_step_low_precision:
+                lp = jnp.sum(expected_states.astype(jnp.bfloat16) * log_likelihoods.astype(jnp.bfloat16),
+                             dtype=jnp.float32)
+            else:
+                lp = jnp.sum(expected_states * log_likelihoods)
+            return lp
+
+        return vmap(_single_expected_log_like)(batch_stats).sum()
+
     def initialize_m_step_state(self, params: ParameterSet, props:PropertySet) -> Any:
         """Initialize any required state for the M step.
 
@@ -459,16 +529,7 @@ class HMMEmissions(ABC):
         # the objective is the negative expected log likelihood (and the log prior of the emission params)
         def neg_expected_log_joint(unc_params):
             params = from_unconstrained(unc_params, props)
-
-            def _single_expected_log_like(stats):
-                expected_states, emissions, inputs = stats
-                log_likelihoods = self._compute_conditional_logliks(params, emissions, inputs)
-                lp = jnp.sum(expected_states * log_likelihoods)
-                return lp
-
-            log_prior = self.log_prior(params)
-            batch_ells = vmap(_single_expected_log_like)(batch_stats)
-            expected_log_joint = log_prior + batch_ells.sum()
+            expected_log_joint = self.log_prior(params) + self._expected_log_likelihood(params, batch_stats)
             return -expected_log_joint / scale
 
         # Run gradient descent
@@ -573,6 +634,9 @@ class HMM(SSM):
         posterior. In the generic case, we simply return the posterior itself.
         """
         args = self._inference_args(params, emissions, inputs)
+        return self._collect_suff_stats(params, args, emissions, inputs)
+
+    def _collect_suff_stats(self, params, args, emissions, inputs=None):
         posterior = hmm_two_filter_smoother(*args)
 
         initial_stats = self.initial_component.collect_suff_stats(params.initial, posterior, inputs)
@@ -580,6 +644,25 @@ class HMM(SSM):
         emission_stats = self.emission_component.collect_suff_stats(params.emissions, posterior, emissions, inputs)
         return (initial_stats, transition_stats, emission_stats), posterior.marginal_loglik
 
+    def _batch_e_step(self, params, batch_emissions, batch_inputs=None, memory_efficient=False):
+        """Map `e_step` over the sequences, so that subclasses overriding it are always used.
+        Without inputs, the initial probabilities and transition matrices do not depend on
+        the mapped emissions, so `vmap` leaves them unbatched and they are computed once.
+
+        The per-sequence statistics of each component are then passed through the
+        component's `reduce_suff_stats` before they reach its M-step. By default this
+        returns them unchanged, since the generic M-steps need the statistics of each
+        sequence. A component whose M-step only uses the sum over sequences can instead
+        return that sum, keeping a leading batch axis of size one, so that the M-step
+        receives the same structure either way.
+        """
+        batch_stats, lls = super()._batch_e_step(params, batch_emissions, batch_inputs, memory_efficient)
+        batch_initial_stats, batch_transition_stats, batch_emission_stats = batch_stats
+        batch_stats = (self.initial_component.reduce_suff_stats(batch_initial_stats),
+                       self.transition_component.reduce_suff_stats(batch_transition_stats),
+                       self.emission_component.reduce_suff_stats(batch_emission_stats))
+        return batch_stats, lls
+
     def initialize_m_step_state(self, params, props):
         """Initialize any required state for the M step.
 
@@ -53,6 +53,9 @@ class BernoulliHMMEmissions(HMMEmissions):
         # of conditionally independent observations.
         return tfd.Independent(tfd.Bernoulli(probs=params.probs[state]), reinterpreted_batch_ndims=1)
 
+    def _batched_distribution(self, params):
+        return tfd.Independent(tfd.Bernoulli(probs=params.probs), reinterpreted_batch_ndims=1)
+
     def log_prior(self, params):
         prior = tfd.Beta(self.emission_prior_concentration1,
                          self.emission_prior_concentration0)
@@ -29,13 +29,15 @@ class CategoricalRegressionHMMEmissions(HMMEmissions):
                  num_classes,
                  input_dim,
                  m_step_optimizer=optax.adam(1e-2),
-                 m_step_num_iters=50):
+                 m_step_num_iters=50,
+                 m_step_low_precision=False):
         """_summary_
 
         Args:
             emission_probs (_type_): _description_
         """
-        super().__init__(m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters)
+        super().__init__(m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters,
+                         m_step_low_precision=m_step_low_precision)
         self.num_states = num_states
         self.num_classes = num_classes
         self.feature_dim = input_dim
@@ -115,6 +117,7 @@ class CategoricalRegressionHMM(HMM):
     :param transition_matrix_stickiness: optional hyperparameter to boost the concentration on the diagonal of the transition matrix.
     :param m_step_optimizer: ``optax`` optimizer, like Adam.
     :param m_step_num_iters: number of optimizer steps per M-step.
+    :param m_step_low_precision: whether to evaluate the expected log likelihood in bfloat16 during the M-step.
 
     """
     def __init__(self,
@@ -125,11 +128,12 @@ class CategoricalRegressionHMM(HMM):
                  transition_matrix_concentration: Union[Scalar, Float[Array, "num_states"]]=1.1,
                  transition_matrix_stickiness: Scalar=0.0,
                  m_step_optimizer: optax.GradientTransformation=optax.adam(1e-2),
-                 m_step_num_iters: int=50):
+                 m_step_num_iters: int=50,
+                 m_step_low_precision: bool=False):
         self.input_dim = input_dim
         initial_component = StandardHMMInitialState(num_states, initial_probs_concentration=initial_probs_concentration)
         transition_component = StandardHMMTransitions(num_states, concentration=transition_matrix_concentration, stickiness=transition_matrix_stickiness)
-        emission_component = CategoricalRegressionHMMEmissions(num_states, num_classes, input_dim, m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters)
+        emission_component = CategoricalRegressionHMMEmissions(num_states, num_classes, input_dim, m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters, m_step_low_precision=m_step_low_precision)
         super().__init__(num_states, initial_component, transition_component, emission_component)
 
     @property
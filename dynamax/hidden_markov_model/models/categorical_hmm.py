@@ -1,6 +1,7 @@
 from typing import NamedTuple, Optional, Tuple, Union
 
 import jax.numpy as jnp
+import numpy as np
 import jax.random as jr
 import tensorflow_probability.substrates.jax.bijectors as tfb
 import tensorflow_probability.substrates.jax.distributions as tfd
@@ -14,7 +15,18 @@ from dynamax.hidden_markov_model.models.transitions import ParamsStandardHMMTran
 from dynamax.hidden_markov_model.models.transitions import StandardHMMTransitions
 from dynamax.parameters import ParameterProperties, ParameterSet, PropertySet
 from dynamax.types import Scalar
-from dynamax.utils.utils import pytree_sum
+from dynamax.utils.utils import is_numpy_eager, pytree_sum
+
+
+def _categorical_logliks_numpy(emissions, probs):
+    """Compute the (num_timesteps, num_states) matrix of categorical log likelihoods in NumPy.
+
+    The emissions must be whole numbers in `[0, num_classes)`.
+    """
+    emission_dim = probs.shape[1]
+    with np.errstate(divide="ignore"):
+        log_probs = np.log(probs)[:, np.arange(emission_dim), emissions.astype(int)]
+    return log_probs.sum(axis=-1).T
 
 
 class ParamsCategoricalHMMEmissions(NamedTuple):
@@ -53,6 +65,20 @@ class CategoricalHMMEmissions(HMMEmissions):
             tfd.Categorical(probs=params.probs[state]),
             reinterpreted_batch_ndims=1)
 
+    def _batched_distribution(self, params):
+        return tfd.Independent(
+            tfd.Categorical(probs=params.probs),
+            reinterpreted_batch_ndims=1)
+
+    def _compute_conditional_logliks(self, params, emissions, inputs=None):
+        # For concrete NumPy emissions, compute the log likelihoods directly in NumPy.
+        # NaN, fractional or out-of-range classes fall back to JAX, as indexing cannot match it.
+        if inputs is None and is_numpy_eager(emissions, params):
+            valid = (emissions >= 0) & (emissions < self.num_classes) & (emissions == np.floor(emissions))
+            if np.all(valid):
+                return _categorical_logliks_numpy(emissions, np.asarray(params.probs))
+        return super()._compute_conditional_logliks(params, emissions, inputs)
+
     def log_prior(self, params):
         return tfd.Dirichlet(self.emission_prior_concentration).log_prob(params.probs).sum()
 
@@ -21,8 +21,10 @@ class GammaHMMEmissions(HMMEmissions):
     def __init__(self,
                  num_states,
                  m_step_optimizer=optax.adam(1e-2),
-                 m_step_num_iters=50):
-        super().__init__(m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters)
+                 m_step_num_iters=50,
+                 m_step_low_precision=False):
+        super().__init__(m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters,
+                         m_step_low_precision=m_step_low_precision)
         self.num_states = num_states
 
     @property
@@ -70,6 +72,10 @@ class GammaHMMEmissions(HMMEmissions):
         return tfd.Gamma(concentration=params.concentration[state],
                          rate=params.rate[state])
 
+    def _batched_distribution(self, params):
+        return tfd.Gamma(concentration=params.concentration,
+                         rate=params.rate)
+
 
 class ParamsGammaHMM(NamedTuple):
     initial: ParamsStandardHMMInitialState
@@ -94,6 +100,7 @@ class GammaHMM(HMM):
     :param transition_matrix_stickiness: optional hyperparameter to boost the concentration on the diagonal of the transition matrix.
     :param m_step_optimizer: ``optax`` optimizer, like Adam.
     :param m_step_num_iters: number of optimizer steps per M-step.
+    :param m_step_low_precision: whether to evaluate the expected log likelihood in bfloat16 during the M-step.
 
     """
     def __init__(self,
@@ -102,10 +109,11 @@ class GammaHMM(HMM):
                  transition_matrix_concentration: Union[Scalar, Float[Array, "num_states"]]=1.1,
                  transition_matrix_stickiness: Scalar=0.0,
                  m_step_optimizer: optax.GradientTransformation=optax.adam(1e-2),
-                 m_step_num_iters: int=50):
+                 m_step_num_iters: int=50,
+                 m_step_low_precision: bool=False):
         initial_component = StandardHMMInitialState(num_states, initial_probs_concentration=initial_probs_concentration)
         transition_component = StandardHMMTransitions(num_states, concentration=transition_matrix_concentration, stickiness=transition_matrix_stickiness)
-        emission_component = GammaHMMEmissions(num_states, m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters)
+        emission_component = GammaHMMEmissions(num_states, m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters, m_step_low_precision=m_step_low_precision)
         super().__init__(num_states, initial_component, transition_component, emission_component)
 
     def initialize(self,
@@ -1,4 +1,5 @@
 import jax.numpy as jnp
+import numpy as np
 import jax.random as jr
 import tensorflow_probability.substrates.jax.bijectors as tfb
 import tensorflow_probability.substrates.jax.distributions as tfd
@@ -16,10 +17,25 @@ from dynamax.utils.distributions import NormalInverseWishart
 from dynamax.utils.distributions import nig_posterior_update
 from dynamax.utils.distributions import niw_posterior_update
 from dynamax.utils.bijectors import RealToPSDBijector
-from dynamax.utils.utils import pytree_sum
+from dynamax.utils.utils import is_numpy_eager, pytree_sum
 from typing import NamedTuple, Optional, Tuple, Union
 
 
+def _gaussian_logliks_numpy(emissions, means, covs):
+    """Compute the (num_timesteps, num_states) matrix of Gaussian log likelihoods in NumPy.
+
+    Raises `np.linalg.LinAlgError` if a covariance is not positive definite.
+    """
+    emission_dim = means.shape[-1]
+    chols = np.linalg.cholesky(covs)
+    diffs = emissions[:, None, :] - means
+    # Whiten the residuals with one solve batched over states, taking all time steps at once.
+    whitened = np.linalg.solve(chols, diffs.transpose(1, 2, 0))
+    mahas = (whitened ** 2).sum(axis=1).T
+    half_logdets = np.log(np.diagonal(chols, axis1=-2, axis2=-1)).sum(axis=-1)
+    return -0.5 * (emission_dim * np.log(2 * np.pi) + mahas) - half_logdets
+
+
 class ParamsGaussianHMMEmissions(NamedTuple):
     means: Union[Float[Array, "state_dim emission_dim"], ParameterProperties]
     covs: Union[Float[Array, "state_dim emission_dim emission_dim"], ParameterProperties]
@@ -58,6 +74,20 @@ class GaussianHMMEmissions(HMMEmissions):
         return tfd.MultivariateNormalFullCovariance(
             params.means[state], params.covs[state])
 
+    def _batched_distribution(self, params):
+        return tfd.MultivariateNormalFullCovariance(params.means, params.covs)
+
+    def _compute_conditional_logliks(self, params, emissions, inputs=None):
+        # For concrete NumPy emissions (e.g. scoring many short sequences outside of jit),
+        # compute the log likelihoods directly in NumPy to avoid JAX's per-op dispatch.
+        # Covariances that are not positive definite fall back to JAX, which returns NaN.
+        if inputs is None and is_numpy_eager(emissions, params):
+            try:
+                return _gaussian_logliks_numpy(emissions, np.asarray(params.means), np.asarray(params.covs))
+            except np.linalg.LinAlgError:
+                pass
+        return super()._compute_conditional_logliks(params, emissions, inputs)
+
     def log_prior(self, params):
         return NormalInverseWishart(self.emission_prior_mean, self.emission_prior_conc,
                                    self.emission_prior_df, self.emission_prior_scale).log_prob(
@@ -199,6 +229,9 @@ class DiagonalGaussianHMMEmissions(HMMEmissions):
         return tfd.MultivariateNormalDiag(params.means[state],
                                           params.scale_diags[state])
 
+    def _batched_distribution(self, params):
+        return tfd.MultivariateNormalDiag(params.means, params.scale_diags)
+
     def log_prior(self, params):
         prior =  NormalInverseGamma(self.emission_prior_mean, self.emission_prior_mean_conc,
                                     self.emission_prior_conc, self.emission_prior_scale)
@@ -248,8 +281,10 @@ class SphericalGaussianHMMEmissions(HMMEmissions):
                  emission_var_concentration=1.1,
                  emission_var_rate=1.1,
                  m_step_optimizer=optax.adam(1e-2),
-                 m_step_num_iters=50):
-        super().__init__(m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters)
+                 m_step_num_iters=50,
+                 m_step_low_precision=False):
+        super().__init__(m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters,
+                         m_step_low_precision=m_step_low_precision)
         self.num_states = num_states
         self.emission_dim = emission_dim
         self.emission_prior_mean = emission_prior_mean * jnp.ones(emission_dim)
@@ -324,6 +359,11 @@ class SphericalGaussianHMMEmissions(HMMEmissions):
         return tfd.MultivariateNormalDiag(params.means[state],
                                           params.scales[state] * jnp.ones((dim,)))
 
+    def _batched_distribution(self, params):
+        dim = self.emission_dim
+        return tfd.MultivariateNormalDiag(params.means,
+                                          params.scales[:, None] * jnp.ones((dim,)))
+
     def log_prior(self, params):
         lp = tfd.MultivariateNormalFullCovariance(
             self.emission_prior_mean, self.emission_prior_mean_cov)\
@@ -424,6 +464,9 @@ class SharedCovarianceGaussianHMMEmissions(HMMEmissions):
         return tfd.MultivariateNormalFullCovariance(
             params.means[state], params.cov)
 
+    def _batched_distribution(self, params):
+        return tfd.MultivariateNormalFullCovariance(params.means, params.cov)
+
     def log_prior(self, params):
         mus = params.means
         Sigma = params.cov
@@ -477,8 +520,10 @@ class LowRankGaussianHMMEmissions(HMMEmissions):
                  emission_diag_factor_concentration=1.1,
                  emission_diag_factor_rate=1.1,
                  m_step_optimizer=optax.adam(1e-2),
-                 m_step_num_iters=50):
-        super().__init__(m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters)
+                 m_step_num_iters=50,
+                 m_step_low_precision=False):
+        super().__init__(m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters,
+                         m_step_low_precision=m_step_low_precision)
         self.num_states = num_states
         self.emission_dim = emission_dim
         self.emission_rank = emission_rank
@@ -782,6 +827,7 @@ class SphericalGaussianHMM(HMM):
     :param emission_var_rate: $\beta_0$
     :param m_step_optimizer: ``optax`` optimizer, like Adam.
     :param m_step_num_iters: number of optimizer steps per M-step.
+    :param m_step_low_precision: whether to evaluate the expected log likelihood in bfloat16 during the M-step.
 
     """
     def __init__(self, num_states: int,
@@ -794,7 +840,8 @@ class SphericalGaussianHMM(HMM):
                  emission_var_concentration: Scalar=1.1,
                  emission_var_rate: Scalar=1.1,
                  m_step_optimizer: optax.GradientTransformation=optax.adam(1e-2),
-                 m_step_num_iters: int=50):
+                 m_step_num_iters: int=50,
+                 m_step_low_precision: bool=False):
         self.emission_dim = emission_dim
         initial_component = StandardHMMInitialState(num_states, initial_probs_concentration=initial_probs_concentration)
         transition_component = StandardHMMTransitions(num_states, concentration=transition_matrix_concentration, stickiness=transition_matrix_stickiness)
@@ -805,7 +852,8 @@ class SphericalGaussianHMM(HMM):
             emission_var_concentration=emission_var_concentration,
             emission_var_rate=emission_var_rate,
             m_step_optimizer=m_step_optimizer,
-            m_step_num_iters=m_step_num_iters)
+            m_step_num_iters=m_step_num_iters,
+            m_step_low_precision=m_step_low_precision)
 
         super().__init__(num_states, initial_component, transition_component, emission_component)
 
@@ -971,6 +1019,7 @@ class LowRankGaussianHMM(HMM):
     :param emission_diag_factor_rate: $\beta_0$
     :param m_step_optimizer: ``optax`` optimizer, like Adam.
     :param m_step_num_iters: number of optimizer steps per M-step.
+    :param m_step_low_precision: whether to evaluate the expected log likelihood in bfloat16 during the M-step.
 
     """
     def __init__(self, num_states: int,
@@ -982,7 +1031,8 @@ class LowRankGaussianHMM(HMM):
                  emission_diag_factor_concentration: Scalar=1.1,
                  emission_diag_factor_rate: Scalar=1.1,
                  m_step_optimizer: optax.GradientTransformation=optax.adam(1e-2),
-                 m_step_num_iters: int=50):
+                 m_step_num_iters: int=50,
+                 m_step_low_precision: bool=False):
 
         self.emission_dim = emission_dim
         initial_component = StandardHMMInitialState(num_states, initial_probs_concentration=initial_probs_concentration)
@@ -992,7 +1042,8 @@ class LowRankGaussianHMM(HMM):
             emission_diag_factor_concentration=emission_diag_factor_concentration,
             emission_diag_factor_rate=emission_diag_factor_rate,
             m_step_optimizer=m_step_optimizer,
-            m_step_num_iters=m_step_num_iters)
+            m_step_num_iters=m_step_num_iters,
+            m_step_low_precision=m_step_low_precision)
         super().__init__(num_states, initial_component, transition_component, emission_component)
 
     def initialize(self, key: jr.PRNGKey=jr.PRNGKey(0),
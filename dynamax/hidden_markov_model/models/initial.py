@@ -55,9 +55,15 @@ class StandardHMMInitialState(HMMInitialState):
     def _compute_initial_probs(self, params, inputs=None):
         return params.probs
 
+    def _compute_log_initial_probs(self, params, inputs=None):
+        return jnp.log(params.probs)
+
     def collect_suff_stats(self, params, posterior, inputs=None):
         return posterior.smoothed_probs[0]
 
+    def reduce_suff_stats(self, batch_stats):
+        return batch_stats.sum(axis=0, keepdims=True)
+
     def initialize_m_step_state(self, params, props):
         return None
 
@@ -66,8 +72,13 @@ class StandardHMMInitialState(HMMInitialState):
             if self.num_states == 1:
                 probs = jnp.array([1.0])
             else:
+                # Closed-form mode of the Dirichlet posterior, which (like tfd.Dirichlet.mode)
+                # is undefined, and hence NaN, unless all concentrations exceed one.
                 expected_initial_counts = batch_stats.sum(axis=0)
-                probs = tfd.Dirichlet(self.initial_probs_concentration + expected_initial_counts).mode()
+                alpha = self.initial_probs_concentration + expected_initial_counts
+                probs = jnp.where(jnp.all(alpha > 1, axis=-1, keepdims=True),
+                                  (alpha - 1) / (alpha - 1).sum(axis=-1, keepdims=True),
+                                  jnp.nan)
             params = params._replace(probs=probs)
         return params, m_step_state
 
@@ -23,8 +23,10 @@ class LogisticRegressionHMMEmissions(HMMEmissions):
                  input_dim,
                  emission_matrices_scale=1e8,
                  m_step_optimizer=optax.adam(1e-2),
-                 m_step_num_iters=50):
-        super().__init__(m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters)
+                 m_step_num_iters=50,
+                 m_step_low_precision=False):
+        super().__init__(m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters,
+                         m_step_low_precision=m_step_low_precision)
         self.num_states = num_states
         self.input_dim = input_dim
         self.emission_weights_scale = emission_matrices_scale
@@ -116,6 +118,7 @@ class LogisticRegressionHMM(HMM):
     :param emission_matrices_scale: $\varsigma$
     :param m_step_optimizer: ``optax`` optimizer, like Adam.
     :param m_step_num_iters: number of optimizer steps per M-step.
+    :param m_step_low_precision: whether to evaluate the expected log likelihood in bfloat16 during the M-step.
 
     """
     def __init__(self,
@@ -126,11 +129,12 @@ class LogisticRegressionHMM(HMM):
                  transition_matrix_stickiness: Scalar=0.0,
                  emission_matrices_scale: Scalar=1e8,
                  m_step_optimizer: optax.GradientTransformation=optax.adam(1e-2),
-                 m_step_num_iters: int=50):
+                 m_step_num_iters: int=50,
+                 m_step_low_precision: bool=False):
         self.inputs_dim = input_dim
         initial_component = StandardHMMInitialState(num_states, initial_probs_concentration=initial_probs_concentration)
         transition_component = StandardHMMTransitions(num_states, concentration=transition_matrix_concentration, stickiness=transition_matrix_stickiness)
-        emission_component = LogisticRegressionHMMEmissions(num_states, input_dim, emission_matrices_scale=emission_matrices_scale, m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters)
+        emission_component = LogisticRegressionHMMEmissions(num_states, input_dim, emission_matrices_scale=emission_matrices_scale, m_step_optimizer=m_step_optimizer, m_step_num_iters=m_step_num_iters, m_step_low_precision=m_step_low_precision)
         super().__init__(num_states, initial_component, transition_component, emission_component)
 
     @property
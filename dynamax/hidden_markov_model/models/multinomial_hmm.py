@@ -63,6 +63,11 @@ class MultinomialHMMEmissions(HMMEmissions):
             tfd.Multinomial(self.num_trials, probs=params.probs[state]),
             reinterpreted_batch_ndims=1)
 
+    def _batched_distribution(self, params):
+        return tfd.Independent(
+            tfd.Multinomial(self.num_trials, probs=params.probs),
+            reinterpreted_batch_ndims=1)
+
     def log_prior(self, params):
         return tfd.Dirichlet(self.emission_prior_concentration).log_prob(params.probs).sum()
 
@@ -68,6 +68,10 @@ class PoissonHMMEmissions(HMMEmissions):
         return tfd.Independent(tfd.Poisson(rate=params.rates[state]),
                                reinterpreted_batch_ndims=1)
 
+    def _batched_distribution(self, params):
+        return tfd.Independent(tfd.Poisson(rate=params.rates),
+                               reinterpreted_batch_ndims=1)
+
     def log_prior(self, params):
         prior = tfd.Gamma(self.emission_prior_concentration, self.emission_prior_rate)
         return prior.log_prob(params.rates).sum()
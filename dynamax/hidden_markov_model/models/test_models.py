@@ -1,9 +1,19 @@
 import pytest
+import warnings
+from typing import NamedTuple
+import numpy as np
 from datetime import datetime
+import jax
 import jax.numpy as jnp
 import jax.random as jr
 from jax import vmap
+from jax.tree_util import tree_leaves
+import tensorflow_probability.substrates.jax.distributions as tfd
 import dynamax.hidden_markov_model as models
+from dynamax.hidden_markov_model.models.abstractions import HMMInitialState, HMMTransitions
+from dynamax.hidden_markov_model.models.initial import StandardHMMInitialState
+from dynamax.hidden_markov_model.models.transitions import StandardHMMTransitions
+from dynamax.parameters import ParameterProperties
 from dynamax.utils.utils import monotonically_increasing
 
 
@@ -28,6 +38,15 @@ CONFIGS = [
 ]
 
 
+def _sample_batch(hmm, key, num_batches=3):
+    """Initialize `hmm` and sample a batch of emission sequences from it."""
+    key1, key2 = jr.split(key)
+    params, param_props = hmm.initialize(key1)
+    sample_emissions = lambda key: hmm.sample(params, key, NUM_TIMESTEPS)[1]
+    emissions = vmap(sample_emissions)(jr.split(key2, num_batches))
+    return params, param_props, emissions
+
+
 @pytest.mark.parametrize(["cls", "kwargs", "inputs"], CONFIGS)
 def test_sample_and_fit(cls, kwargs, inputs):
     hmm = cls(**kwargs)
@@ -40,6 +59,24 @@ def test_sample_and_fit(cls, kwargs, inputs):
     fitted_params, lps = hmm.fit_sgd(params, param_props, emissions, inputs=inputs, num_epochs=10)
 
 
+@pytest.mark.parametrize(["cls", "kwargs"], [(cls, kwargs) for cls, kwargs, inputs in CONFIGS if inputs is None])
+def test_batched_distribution_logliks(cls, kwargs, key=jr.PRNGKey(0)):
+    # Broadcasting the emissions against the batched emission distribution should
+    # give the same log likelihoods as evaluating each state's distribution in turn.
+    key1, key2 = jr.split(key)
+    hmm = cls(**kwargs)
+    params, _ = hmm.initialize(key1)
+    _, emissions = hmm.sample(params, key2, NUM_TIMESTEPS)
+
+    emission_component = hmm.emission_component
+    lls = emission_component._compute_conditional_logliks(params.emissions, emissions)
+    per_state_lls = lambda emission: vmap(
+        lambda state: emission_component.distribution(params.emissions, state).log_prob(emission))(
+            jnp.arange(hmm.num_states))
+    assert lls.shape == (NUM_TIMESTEPS, hmm.num_states)
+    assert jnp.allclose(lls, vmap(per_state_lls)(emissions), rtol=1e-5, atol=1e-4)
+
+
 ## A few model-specific tests
 def test_categorical_hmm_viterbi():
     # From http://en.wikipedia.org/wiki/Viterbi_algorithm:
@@ -100,6 +137,271 @@ def test_sample_and_fit_arhmm():
     fitted_params, lps = arhmm.fit_sgd(params, param_props, emissions, inputs=inputs, num_epochs=10)
 
 
+def test_standard_hmm_inference_args(key=jr.PRNGKey(0), num_states=4, emission_dim=3):
+    key1, key2 = jr.split(key)
+    hmm = models.GaussianHMM(num_states, emission_dim)
+    params, _ = hmm.initialize(key1)
+    _, emissions = hmm.sample(params, key2, NUM_TIMESTEPS)
+
+    # The standard components should pass their parameters straight through,
+    # so that the transition matrix is 2D and the transition probs are summed.
+    initial_probs, transition_matrix, _ = hmm._inference_args(params, emissions, None)
+    assert transition_matrix.ndim == 2
+    assert jnp.allclose(initial_probs, params.initial.probs)
+    assert jnp.allclose(transition_matrix, params.transitions.transition_matrix)
+
+
+@pytest.mark.parametrize(["cls", "kwargs"], [
+    (models.GaussianHMM, dict(num_states=4, emission_dim=3)),
+    (models.GammaHMM, dict(num_states=4)),
+])
+def test_fit_em_verbose_matches_scan(cls, kwargs, key=jr.PRNGKey(0)):
+    # The Python loop (verbose) and the single lax.scan (not verbose) should run the same
+    # EM iterations, including the optimizer state carried by a gradient-based M-step.
+    hmm = cls(**kwargs)
+    params, param_props, emissions = _sample_batch(hmm, key)
+    params_loop, lps_loop = hmm.fit_em(params, param_props, emissions, num_iters=5, verbose=True)
+    params_scan, lps_scan = hmm.fit_em(params, param_props, emissions, num_iters=5, verbose=False)
+    assert jnp.allclose(lps_loop, lps_scan, rtol=1e-4)
+    for leaf_loop, leaf_scan in zip(tree_leaves(params_loop), tree_leaves(params_scan)):
+        assert jnp.allclose(leaf_loop, leaf_scan, rtol=1e-4, atol=1e-5)
+
+
+def test_fit_em_memory_efficient(key=jr.PRNGKey(0), num_states=4, emission_dim=3):
+    hmm = models.GaussianHMM(num_states, emission_dim)
+    params, param_props, emissions = _sample_batch(hmm, key)
+
+    _, lps = hmm.fit_em(params, param_props, emissions, num_iters=5, verbose=False)
+    _, lps_mem = hmm.fit_em(params, param_props, emissions, num_iters=5, verbose=False, memory_efficient=True)
+    assert jnp.allclose(lps, lps_mem, rtol=1e-4)
+
+
+def test_fit_em_uses_e_step_override(key=jr.PRNGKey(0), num_states=4, emission_dim=3):
+    # A subclass overriding the public e_step hook should be used by fit_em,
+    # with or without inputs.
+    class RecordingGaussianHMM(models.GaussianHMM):
+        calls = []
+
+        def e_step(self, params, emissions, inputs=None):
+            self.calls.append(inputs is None)
+            return super().e_step(params, emissions, inputs)
+
+    hmm = RecordingGaussianHMM(num_states, emission_dim)
+    params, param_props, emissions = _sample_batch(hmm, key)
+    hmm.fit_em(params, param_props, emissions, num_iters=2, verbose=False)
+    assert set(hmm.calls) == {True}
+    hmm.fit_em(params, param_props, emissions, inputs=jnp.zeros(emissions.shape[:2] + (1,)),
+               num_iters=2, verbose=False)
+    assert set(hmm.calls) == {True, False}
+
+
+def test_reduced_suff_stats(key=jr.PRNGKey(0), num_states=4, emission_dim=3):
+    hmm = models.GaussianHMM(num_states, emission_dim)
+    params, param_props, emissions = _sample_batch(hmm, key)
+
+    # The standard components sum their statistics over sequences in the E-step,
+    # keeping a leading batch axis of size one
+    batch_stats, _ = vmap(lambda e: hmm.e_step(params, e))(emissions)
+    reduced_stats, _ = hmm._batch_e_step(params, emissions)
+    assert reduced_stats[0].shape == (1, num_states)
+    assert reduced_stats[1].shape == (1, num_states, num_states)
+
+    # and the M-step should give the same parameters as with the per-sequence statistics
+    m_step_state = hmm.initialize_m_step_state(params, param_props)
+    new_params, _ = hmm.m_step(params, param_props, batch_stats, m_step_state)
+    new_params_reduced, _ = hmm.m_step(params, param_props, reduced_stats, m_step_state)
+    assert jnp.allclose(new_params.initial.probs, new_params_reduced.initial.probs)
+    assert jnp.allclose(new_params.transitions.transition_matrix, new_params_reduced.transitions.transition_matrix)
+    assert jnp.allclose(new_params.emissions.means, new_params_reduced.emissions.means, atol=1e-5)
+
+
+def test_standard_m_step_dirichlet_mode(num_states=3):
+    # The closed-form M-steps should match the Dirichlet mode, including its NaN
+    # when a concentration is at most one.
+    initial_counts = jnp.array([[2.0, 0.0, 1.0]])
+    for concentration in [1.5, 0.5]:
+        initial = StandardHMMInitialState(num_states, initial_probs_concentration=concentration)
+        params, props = initial.initialize(initial_probs=jnp.ones(num_states) / num_states)
+        params, _ = initial.m_step(params, props, initial_counts, None)
+        mode = tfd.Dirichlet(concentration + initial_counts[0]).mode()
+        assert jnp.allclose(params.probs, mode, equal_nan=True)
+    assert jnp.all(jnp.isnan(params.probs))
+
+    trans_counts = jnp.array([[[2.0, 0.0, 1.0], [1.0, 1.0, 1.0], [3.0, 2.0, 1.0]]])
+    transitions = StandardHMMTransitions(num_states, concentration=0.5)
+    params, props = transitions.initialize(transition_matrix=jnp.ones((num_states, num_states)) / num_states)
+    params, _ = transitions.m_step(params, props, trans_counts, None)
+    mode = tfd.Dirichlet(0.5 + trans_counts[0]).mode()
+    assert jnp.allclose(params.transition_matrix, mode, equal_nan=True)
+    assert jnp.all(jnp.isnan(params.transition_matrix[0]))
+    assert not jnp.any(jnp.isnan(params.transition_matrix[1:]))
+
+
+class ParamsLogitsComponent(NamedTuple):
+    logits: jnp.ndarray
+    weights: jnp.ndarray
+
+
+class LogitsHMMInitialState(HMMInitialState):
+    """Initial distribution with input-dependent logits, fit with the generic M-step."""
+    def __init__(self, num_states, input_dim):
+        super().__init__(m_step_num_iters=20)
+        self.num_states = num_states
+        self.input_dim = input_dim
+
+    def distribution(self, params, inputs=None):
+        logits = params.logits if inputs is None else params.logits + params.weights @ inputs
+        return tfd.Categorical(logits=logits)
+
+    def initialize(self, key=None, method="prior", **kwargs):
+        key1, key2 = jr.split(key)
+        params = ParamsLogitsComponent(logits=jr.normal(key1, (self.num_states,)),
+                                       weights=jr.normal(key2, (self.num_states, self.input_dim)))
+        props = ParamsLogitsComponent(logits=ParameterProperties(), weights=ParameterProperties())
+        return params, props
+
+    def log_prior(self, params):
+        return 0.0
+
+
+class LogitsHMMTransitions(HMMTransitions):
+    """Transition distribution with input-dependent logits, fit with the generic M-step."""
+    def __init__(self, num_states, input_dim):
+        super().__init__(m_step_num_iters=20)
+        self.num_states = num_states
+        self.input_dim = input_dim
+
+    def distribution(self, params, state, inputs=None):
+        logits = params.logits[state] if inputs is None else params.logits[state] + params.weights[state] @ inputs
+        return tfd.Categorical(logits=logits)
+
+    def initialize(self, key=None, method="prior", **kwargs):
+        key1, key2 = jr.split(key)
+        params = ParamsLogitsComponent(logits=jr.normal(key1, (self.num_states, self.num_states)),
+                                       weights=jr.normal(key2, (self.num_states, self.num_states, self.input_dim)))
+        props = ParamsLogitsComponent(logits=ParameterProperties(), weights=ParameterProperties())
+        return params, props
+
+    def log_prior(self, params):
+        return 0.0
+
+
+@pytest.mark.parametrize("use_inputs", [False, True])
+def test_generic_initial_and_transition_m_steps(use_inputs, key=jr.PRNGKey(0), num_states=3, input_dim=2, num_batches=4):
+    keys = jr.split(key, 5)
+    initial = LogitsHMMInitialState(num_states, input_dim)
+    transitions = LogitsHMMTransitions(num_states, input_dim)
+    initial_params, initial_props = initial.initialize(keys[0])
+    trans_params, trans_props = transitions.initialize(keys[1])
+
+    # Random expected initial states and transitions, shaped like the output of the E-step
+    dirichlet = tfd.Dirichlet(jnp.ones(num_states))
+    expected_initial_states = dirichlet.sample(num_batches, seed=keys[2])
+    if use_inputs:
+        inputs = jr.normal(keys[3], (num_batches, NUM_TIMESTEPS, input_dim))
+        expected_transitions = dirichlet.sample((num_batches, NUM_TIMESTEPS - 1, num_states), seed=keys[4])
+        initial_stats = (expected_initial_states, inputs[:, 0])
+        trans_stats = (expected_transitions, inputs)
+    else:
+        expected_transitions = NUM_TIMESTEPS * dirichlet.sample((num_batches, num_states), seed=keys[4])
+        initial_stats = (expected_initial_states, None)
+        trans_stats = (expected_transitions, None)
+
+    # Reference: take the log of each sequence's probabilities and contract it with its statistics
+    def per_sequence_ell(compute_probs, params, stats):
+        expected, inputs = stats
+        return sum(jnp.sum(expected[i] * jnp.log(compute_probs(params, None if inputs is None else inputs[i])))
+                   for i in range(num_batches))
+
+    for component, params, props, stats, compute_probs in [
+        (initial, initial_params, initial_props, initial_stats, initial._compute_initial_probs),
+        (transitions, trans_params, trans_props, trans_stats, transitions._compute_transition_matrices)]:
+        ell = component._expected_log_likelihood(params, stats)
+        assert jnp.allclose(ell, per_sequence_ell(compute_probs, params, stats), rtol=1e-4)
+
+        # The generic M-step should increase the expected log likelihood
+        m_step_state = component.initialize_m_step_state(params, props)
+        new_params, _ = component.m_step(params, props, stats, m_step_state)
+        assert component._expected_log_likelihood(new_params, stats) > ell
+
+
+def test_m_step_low_precision(key=jr.PRNGKey(0), num_states=4):
+    hmm = models.GammaHMM(num_states)
+    hmm_bf16 = models.GammaHMM(num_states, m_step_low_precision=True)
+    params, param_props, emissions = _sample_batch(hmm, key)
+
+    # The bfloat16 expected log likelihood should stay close to the float32 one
+    (_, _, emission_stats), _ = hmm._batch_e_step(params, emissions)
+    ell = hmm.emission_component._expected_log_likelihood(params.emissions, emission_stats)
+    ell_bf16 = hmm_bf16.emission_component._expected_log_likelihood(params.emissions, emission_stats)
+    assert ell_bf16.dtype == ell.dtype
+    assert jnp.allclose(ell, ell_bf16, rtol=1e-2)
+
+    # and so should the fits
+    _, lps = hmm.fit_em(params, param_props, emissions, num_iters=5, verbose=False)
+    _, lps_bf16 = hmm_bf16.fit_em(params, param_props, emissions, num_iters=5, verbose=False)
+    assert jnp.allclose(lps, lps_bf16, rtol=1e-2)
+
+
+@pytest.mark.parametrize(["cls", "kwargs", "dtype"], [
+    (models.GaussianHMM, dict(num_states=4, emission_dim=3), None),
+    (models.CategoricalHMM, dict(num_states=4, emission_dim=3, num_classes=5), None),
+    (models.CategoricalHMM, dict(num_states=4, emission_dim=3, num_classes=5), float),
+])
+def test_numpy_conditional_logliks(cls, kwargs, dtype, key=jr.PRNGKey(0)):
+    key1, key2 = jr.split(key)
+    hmm = cls(**kwargs)
+    params, _ = hmm.initialize(key1)
+    _, emissions = hmm.sample(params, key2, NUM_TIMESTEPS)
+    np_emissions = np.asarray(emissions, dtype=dtype)
+
+    # The NumPy path for concrete emissions should agree with the JAX path.
+    lls_jax = hmm.emission_component._compute_conditional_logliks(params.emissions, emissions)
+    lls_np = hmm.emission_component._compute_conditional_logliks(params.emissions, np_emissions)
+    if jax.default_backend() == "cpu":
+        assert isinstance(lls_np, np.ndarray)
+    assert jnp.allclose(lls_jax, lls_np, atol=1e-4)
+    assert jnp.allclose(hmm.marginal_log_prob(params, emissions),
+                        hmm.marginal_log_prob(params, np_emissions), atol=1e-3)
+
+
+def test_numpy_conditional_logliks_edge_cases(key=jr.PRNGKey(0), num_states=4, emission_dim=3, num_classes=5):
+    key1, key2, key3, key4 = jr.split(key, 4)
+
+    # A covariance that is not positive definite gives NaN, as in JAX, rather than raising.
+    hmm = models.GaussianHMM(num_states, emission_dim)
+    params, _ = hmm.initialize(key1)
+    _, emissions = hmm.sample(params, key2, NUM_TIMESTEPS)
+    covs = params.emissions.covs.at[0].set(-jnp.eye(emission_dim))
+    emission_params = params.emissions._replace(covs=covs)
+    lls_jax = hmm.emission_component._compute_conditional_logliks(emission_params, emissions)
+    lls_np = hmm.emission_component._compute_conditional_logliks(emission_params, np.asarray(emissions))
+    assert jnp.all(jnp.isnan(lls_jax[:, 0]))
+    assert jnp.allclose(lls_jax, lls_np, atol=1e-4, equal_nan=True)
+
+    # NaN, fractional and out-of-range classes match JAX rather than raising.
+    hmm = models.CategoricalHMM(num_states, emission_dim, num_classes)
+    params, _ = hmm.initialize(key3)
+    _, emissions = hmm.sample(params, key4, NUM_TIMESTEPS)
+    for bad_value in [jnp.nan, 1.5, num_classes, -1]:
+        np_emissions = np.array(emissions, dtype=float)
+        np_emissions[0, 0] = bad_value
+        lls_jax = hmm.emission_component._compute_conditional_logliks(params.emissions, jnp.asarray(np_emissions))
+        lls_np = hmm.emission_component._compute_conditional_logliks(params.emissions, np_emissions)
+        assert jnp.allclose(lls_jax, lls_np, atol=1e-4, equal_nan=True)
+
+    # Zero probabilities give -inf log likelihoods without divide-by-zero warnings.
+    probs = params.emissions.probs.at[:, :, 0].set(0.0)
+    emission_params = params.emissions._replace(probs=probs / probs.sum(axis=-1, keepdims=True))
+    np_emissions = np.asarray(emissions)
+    lls_jax = hmm.emission_component._compute_conditional_logliks(emission_params, emissions)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        lls_np = hmm.emission_component._compute_conditional_logliks(emission_params, np_emissions)
+    assert isinstance(lls_np, np.ndarray) or jax.default_backend() != "cpu"
+    assert jnp.allclose(lls_jax, lls_np, atol=1e-4)
+
+
 # @pytest.mark.skip(reason="this would introduce a torch dependency")
 # def test_hmm_fit_stochastic_em(num_iters=100):
 #     """Evaluate stochastic em fit with respect to exact em fit."""
@@ -68,9 +68,15 @@ class StandardHMMTransitions(HMMTransitions):
     def _compute_transition_matrices(self, params, inputs=None):
         return params.transition_matrix
 
+    def _compute_log_transition_matrices(self, params, inputs=None):
+        return jnp.log(params.transition_matrix)
+
     def collect_suff_stats(self, params, posterior, inputs=None):
         return posterior.trans_probs
 
+    def reduce_suff_stats(self, batch_stats):
+        return batch_stats.sum(axis=0, keepdims=True)
+
     def initialize_m_step_state(self, params, props):
         return None
 
@@ -79,7 +85,12 @@ class StandardHMMTransitions(HMMTransitions):
             if self.num_states == 1:
                 transition_matrix = jnp.array([[1.0]])
             else:
+                # Closed-form mode of the Dirichlet posterior on each row, which (like
+                # tfd.Dirichlet.mode) is NaN unless all concentrations in the row exceed one.
                 expected_trans_counts = batch_stats.sum(axis=0)
-                transition_matrix = tfd.Dirichlet(self.concentration + expected_trans_counts).mode()
+                alpha = self.concentration + expected_trans_counts
+                transition_matrix = jnp.where(jnp.all(alpha > 1, axis=-1, keepdims=True),
+                                              (alpha - 1) / (alpha - 1).sum(axis=-1, keepdims=True),
+                                              jnp.nan)
             params = params._replace(transition_matrix=transition_matrix)
         return params, m_step_state
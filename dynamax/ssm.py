@@ -4,9 +4,11 @@ from fastprogress.fastprogress import progress_bar
 from functools import partial
 import jax.numpy as jnp
 import jax.random as jr
-from jax import jit, lax, vmap
+import numpy as np
+from jax import jit, lax, local_devices, vmap
+from jax.sharding import Mesh, NamedSharding, PartitionSpec
 from jax.tree_util import tree_map
-from jaxtyping import Float, Array, PyTree
+from jaxtyping import Float, Array
 import optax
 from tensorflow_probability.substrates.jax import distributions as tfd
 from typing import Optional, Union, Tuple, Any
@@ -320,6 +322,32 @@ class SSM(ABC):
         """
         raise NotImplementedError
 
+    def _batch_e_step(
+        self,
+        params: ParameterSet,
+        batch_emissions: Float[Array, "num_batches num_timesteps emission_dim"],
+        batch_inputs: Optional[Float[Array, "num_batches num_timesteps input_dim"]]=None,
+        memory_efficient: bool=False
+    ) -> Tuple[SuffStatsSSM, Float[Array, "num_batches"]]:
+        r"""Perform an E-step on each sequence in a batch.
+
+        Subclasses may override this to share work across sequences.
+
+        Args:
+            params: model parameters $\theta$
+            batch_emissions: batch of emission sequences
+            batch_inputs: optional batch of input sequences
+            memory_efficient: process the sequences one at a time with :func:`jax.lax.map` instead of :func:`jax.vmap`
+
+        Returns:
+            Expected sufficient statistics and marginal log likelihood of each sequence.
+
+        """
+        f = partial(self.e_step, params)
+        if memory_efficient:
+            return lax.map(lambda args: f(*args), (batch_emissions, batch_inputs))
+        return vmap(f)(batch_emissions, batch_inputs)
+
     def m_step(
         self,
         params: ParameterSet,
@@ -354,7 +382,8 @@ class SSM(ABC):
         inputs: Optional[Union[Float[Array, "num_timesteps input_dim"],
                                Float[Array, "num_batches num_timesteps input_dim"]]]=None,
         num_iters: int=50,
-        verbose: bool=True
+        verbose: bool=True,
+        memory_efficient: bool=False
     ) -> Tuple[ParameterSet, Float[Array, "num_iters"]]:
         r"""Compute parameter MLE/ MAP estimate using Expectation-Maximization (EM).
 
@@ -366,6 +395,10 @@ class SSM(ABC):
 
         *Note:* ``emissions`` *and* ``inputs`` *can either be single sequences or batches of sequences.*
 
+        *Note:* with ``verbose=False`` all ``num_iters`` iterations are compiled into a single
+        :func:`jax.lax.scan`, which avoids a round trip to the host on every iteration.
+        The progress bar requires stepping through the iterations from Python.
+
         Args:
             params: model parameters $\theta$
             props: properties specifying which parameters should be learned
@@ -373,6 +406,11 @@ class SSM(ABC):
             inputs: one or more sequences of corresponding inputs
             num_iters: number of iterations of EM to run
             verbose: whether or not to show a progress bar
+            memory_efficient: whether to run the E-step on one sequence at a time.
+                By default, the E-step is vmapped over sequences, which runs them in parallel
+                but holds the posteriors of all sequences in memory at once. Setting this flag
+                runs the sequences sequentially with :func:`jax.lax.map`, trading parallelism
+                for memory that does not grow with the number of sequences.
 
         Returns:
             tuple of new parameters and log likelihoods over the course of EM iterations.
@@ -383,22 +421,42 @@ class SSM(ABC):
         batch_emissions = ensure_array_has_batch_dim(emissions, self.emission_shape)
         batch_inputs = ensure_array_has_batch_dim(inputs, self.inputs_shape)
 
-        @jit
         def em_step(params, m_step_state):
-            batch_stats, lls = vmap(partial(self.e_step, params))(batch_emissions, batch_inputs)
+            batch_stats, lls = self._batch_e_step(params, batch_emissions, batch_inputs, memory_efficient)
             lp = self.log_prior(params) + lls.sum()
             params, m_step_state = self.m_step(params, props, batch_stats, m_step_state)
             # debug.print('e_step: {x}', x=(batch_stats, lls))
             # debug.print('m_step{y}', y=params)
             return params, m_step_state, lp
 
-        log_probs = []
         m_step_state = self.initialize_m_step_state(params, props)
-        pbar = progress_bar(range(num_iters)) if verbose else range(num_iters)
-        for _ in pbar:
-            params, m_step_state, marginal_loglik = em_step(params, m_step_state)
-            log_probs.append(marginal_loglik)
-        return params, jnp.array(log_probs)
+        if not verbose:
+            @jit
+            def run_em(params, m_step_state):
+                def _step(carry, _):
+                    params, m_step_state = carry
+                    params, m_step_state, lp = em_step(params, m_step_state)
+                    return (params, m_step_state), lp
+
+                (params, m_step_state), log_probs = \
+                    lax.scan(_step, (params, m_step_state), None, length=num_iters)
+                return params, log_probs
+
+            return run_em(params, m_step_state)
+
+        # The M-step state and the log probabilities are created here and threaded through
+        # each step, so their buffers can be donated and reused in place. The params belong
+        # to the caller, so they are not donated.
+        @partial(jit, donate_argnums=(1, 2))
+        def verbose_em_step(params, m_step_state, log_probs, itr):
+            params, m_step_state, lp = em_step(params, m_step_state)
+            return params, m_step_state, log_probs.at[itr].set(lp)
+
+        # Keep the log probabilities on the device rather than collecting them in a list
+        log_probs = jnp.zeros(num_iters)
+        for itr in progress_bar(range(num_iters)):
+            params, m_step_state, log_probs = verbose_em_step(params, m_step_state, log_probs, itr)
+        return params, log_probs
 
     def fit_sgd(
         self,
@@ -427,6 +485,9 @@ class SSM(ABC):
         On each iteration, the algorithm grabs a *minibatch* of sequences and takes a gradient step.
         One pass through the entire set of sequences is called an *epoch*.
 
+        If there are multiple local devices and the minibatch size is divisible by their number,
+        the minibatch is sharded evenly across the devices within the jitted SGD loop.
+
         Args:
             params: model parameters $\theta$
             props: properties specifying which parameters should be learned
@@ -448,11 +509,22 @@ class SSM(ABC):
 
         unc_params = to_unconstrained(params, props)
 
+        # With multiple devices, shard each minibatch along its batch axis so that XLA
+        # splits the sequences across the devices and sums their log probabilities.
+        devices = local_devices()
+        num_devices = len(devices)
+        if num_devices > 1:
+            batch_sharding = NamedSharding(Mesh(np.array(devices), ("batch",)), PartitionSpec("batch"))
+
         def _loss_fn(unc_params, minibatch):
             """Default objective function."""
             params = from_unconstrained(unc_params, props)
             minibatch_emissions, minibatch_inputs = minibatch
-            scale = len(batch_emissions) / len(minibatch_emissions)
+            scale = batch_emissions.shape[0] / minibatch_emissions.shape[0]
+            if num_devices > 1 and minibatch_emissions.shape[0] % num_devices == 0:
+                minibatch_emissions, minibatch_inputs = tree_map(
+                    lambda x: lax.with_sharding_constraint(x, batch_sharding),
+                    (minibatch_emissions, minibatch_inputs))
             minibatch_lls = vmap(partial(self.marginal_log_prob, params))(minibatch_emissions, minibatch_inputs)
             lp = self.log_prior(params) + minibatch_lls.sum() * scale
             return -lp / batch_emissions.size
@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+import jax.numpy as jnp
+
+
+SHARDED_FIT_SGD_SCRIPT = """
+import json
+import jax
+import jax.random as jr
+import optax
+from jax.tree_util import tree_leaves
+import dynamax.hidden_markov_model as models
+
+assert jax.local_device_count() == {num_devices}
+hmm = models.GaussianHMM(num_states=3, emission_dim=2)
+params, props = hmm.initialize(jr.PRNGKey(0))
+emissions = jax.vmap(lambda key: hmm.sample(params, key, 20)[1])(jr.split(jr.PRNGKey(1), 4))
+
+# A single plain SGD step on the whole batch, so the update reveals the gradient
+fitted_params, losses = hmm.fit_sgd(params, props, emissions, optimizer=optax.sgd(1e-2),
+                                    batch_size=4, num_epochs=1)
+print(json.dumps(dict(losses=losses.tolist(),
+                      params=[leaf.tolist() for leaf in tree_leaves(fitted_params)])))
+"""
+
+
+def _run_fit_sgd_on_host_devices(num_devices):
+    env = dict(os.environ, JAX_PLATFORMS="cpu",
+               XLA_FLAGS="--xla_force_host_platform_device_count={}".format(num_devices))
+    script = SHARDED_FIT_SGD_SCRIPT.format(num_devices=num_devices)
+    result = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_fit_sgd_sharded_matches_single_device():
+    # Each run needs its own process, since the number of host devices is fixed at startup.
+    single = _run_fit_sgd_on_host_devices(1)
+    sharded = _run_fit_sgd_on_host_devices(2)
+    assert jnp.allclose(jnp.array(single["losses"]), jnp.array(sharded["losses"]), rtol=1e-5)
+    for leaf, sharded_leaf in zip(single["params"], sharded["params"]):
+        assert jnp.allclose(jnp.array(leaf), jnp.array(sharded_leaf), rtol=1e-4, atol=1e-5)
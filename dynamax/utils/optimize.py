@@ -1,23 +1,10 @@
 import jax.numpy as jnp
 import jax.random as jr
 import optax
-from jax import lax, value_and_grad, tree_map
+from jax import jit, lax, value_and_grad, tree_map
 from dynamax.utils.utils import pytree_len
 
 
-def sample_minibatches(key, dataset, batch_size, shuffle):
-    """Sequence generator.
-
-    NB: The generator does not preform as expected when used to yield data
-        within jit'd code. This is likely because the generator internally
-        updates a state with each yield (which doesn't play well with jit).
-    """
-    n_data = pytree_len(dataset)
-    perm = jnp.where(shuffle, jr.permutation(key, n_data), jnp.arange(n_data))
-    for idx in range(0, n_data, batch_size):
-        yield tree_map(lambda x: x[perm[idx:min(idx + batch_size, n_data)]], dataset)
-
-
 def run_sgd(loss_fn,
             params,
             dataset,
@@ -33,6 +20,12 @@ def run_sgd(loss_fn,
     of entire sequence, not time steps, is sampled at each step where B is
     batch size.
 
+    Each epoch splits a (optionally permuted) array of sequence indices into
+    minibatches of shape (num_minibatches, B) and runs a single `lax.scan`
+    over them, gathering each minibatch from the dataset as it is needed.
+    If N is not a multiple of B, the leftover sequences form one extra,
+    smaller minibatch at the end of the epoch.
+
     Args:
         loss_fn: Objective function.
         params: initial value of parameters to be estimated.
@@ -48,36 +41,44 @@ def run_sgd(loss_fn,
         losses: Output of loss_fn stored at each step.
     """
     opt_state = optimizer.init(params)
-    num_batches = pytree_len(dataset)
-    num_complete_batches, leftover = jnp.divmod(num_batches, batch_size)
-    num_batches = num_complete_batches + jnp.where(leftover == 0, 0, 1)
+    num_data = pytree_len(dataset)
+    num_complete_batches, leftover = divmod(num_data, batch_size)
     loss_grad_fn = value_and_grad(loss_fn)
 
-    if batch_size >= num_batches:
+    if batch_size >= num_data:
         shuffle = False
 
-    def train_step(carry, key):
+    def sgd_step(carry, minibatch_idx):
         params, opt_state = carry
-        sample_generator = sample_minibatches(key, dataset, batch_size, shuffle)
+        minibatch = tree_map(lambda x: jnp.take(x, minibatch_idx, axis=0), dataset)
+        this_loss, grads = loss_grad_fn(params, minibatch)
+        updates, opt_state = optimizer.update(grads, opt_state)
+        params = optax.apply_updates(params, updates)
+        return (params, opt_state), this_loss
+
+    def train_step(carry, key):
+        # Permute indices rather than the dataset itself, to avoid copying the data
+        perm = jr.permutation(key, num_data) if shuffle else jnp.arange(num_data)
+
+        # Scan over the complete minibatches
+        minibatch_idxs = perm[:num_complete_batches * batch_size].reshape((num_complete_batches, batch_size))
+        carry, losses = lax.scan(sgd_step, carry, minibatch_idxs)
 
-        def cond_fun(state):
-            itr, params, opt_state, avg_loss = state
-            return itr < num_batches
+        # Take one more step on the leftover sequences, if any
+        if leftover > 0:
+            carry, this_loss = sgd_step(carry, perm[-leftover:])
+            losses = jnp.append(losses, this_loss)
 
-        def body_fun(state):
-            itr, params, opt_state, avg_loss = state
-            minibatch = next(sample_generator)  ## TODO: Does this work inside while_loop??
-            this_loss, grads = loss_grad_fn(params, minibatch)
-            updates, opt_state = optimizer.update(grads, opt_state)
-            params = optax.apply_updates(params, updates)
-            return itr + 1, params, opt_state, (avg_loss * itr + this_loss) / (itr + 1)
+        return carry, losses.mean()
 
-        init_val = (0, params, opt_state, 0.0)
-        _, params, opt_state, avg_loss = lax.while_loop(cond_fun, body_fun, init_val)
-        return (params, opt_state), avg_loss
+    # Run all the epochs in one jitted computation, so that any sharding
+    # constraints in the loss function apply to the whole training loop.
+    @jit
+    def train(params, opt_state, keys):
+        return lax.scan(train_step, (params, opt_state), keys)
 
     keys = jr.split(key, num_epochs)
-    (params, _), losses = lax.scan(train_step, (params, opt_state), keys)
+    (params, _), losses = train(params, opt_state, keys)
     return params, losses
 
 
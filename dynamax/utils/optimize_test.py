@@ -0,0 +1,45 @@
+import pytest
+import jax.numpy as jnp
+import jax.random as jr
+import optax
+from jax import lax
+
+from dynamax.utils.optimize import run_sgd
+
+
+def _record_minibatches(params, minibatch):
+    """A loss whose SGD updates record which indices each step sees.
+
+    With `optax.sgd(1.0)`, each step increments `params["step"]` by one and adds
+    the indicator of the current minibatch to the row of `params["seen"]` for that step.
+    """
+    step = lax.stop_gradient(params["step"]).astype(int)
+    mask = jnp.zeros_like(params["seen"]).at[step, minibatch].set(1.0)
+    return -params["step"] - jnp.sum(mask * params["seen"])
+
+
+@pytest.mark.parametrize(["num_data", "batch_size"], [(6, 2), (7, 3)])
+def test_run_sgd_minibatches(num_data, batch_size):
+    """Test that each step of an epoch sees a different block of the data,
+    including the leftover minibatch when batch_size does not divide the data.
+    """
+    num_steps = -(-num_data // batch_size)
+    params = dict(step=jnp.array(0.0), seen=jnp.zeros((num_steps, num_data)))
+    dataset = jnp.arange(num_data)
+
+    params, losses = run_sgd(_record_minibatches, params, dataset,
+                             optimizer=optax.sgd(1.0), batch_size=batch_size, num_epochs=1)
+    assert losses.shape == (1,)
+    assert jnp.allclose(params["step"], num_steps)
+
+    # Without shuffling, step s sees the s-th contiguous block of indices
+    blocks = jnp.arange(num_data) // batch_size
+    assert jnp.allclose(params["seen"], (blocks[None, :] == jnp.arange(num_steps)[:, None]).astype(float))
+
+    # With shuffling, the steps still partition the data
+    params = dict(step=jnp.array(0.0), seen=jnp.zeros((num_steps, num_data)))
+    params, _ = run_sgd(_record_minibatches, params, dataset,
+                        optimizer=optax.sgd(1.0), batch_size=batch_size, num_epochs=1,
+                        shuffle=True, key=jr.PRNGKey(0))
+    assert jnp.allclose(params["seen"].sum(axis=0), 1.0)
+    assert jnp.allclose(params["seen"].sum(axis=1), jnp.bincount(blocks, length=num_steps))
@@ -6,6 +6,7 @@ from jax import vmap
 from jax.tree_util import tree_map, tree_leaves, tree_flatten, tree_unflatten
 import jax
 import jaxlib
+import numpy as np
 from jaxtyping import Array, Int
 from scipy.optimize import linear_sum_assignment
 from typing import Optional
@@ -53,7 +54,15 @@ def pytree_len(pytree):
     if pytree is None:
         return 0
     else:
-        return len(tree_leaves(pytree)[0])
+        return tree_leaves(pytree)[0].shape[0]
+
+
+def is_numpy_eager(array, pytree=None):
+    """Return True if `array` is a NumPy array, no leaf of `pytree` is being traced,
+    and JAX is running on the CPU, i.e. the computation can be done eagerly in NumPy
+    without going through JAX or copying the leaves of `pytree` off an accelerator."""
+    return isinstance(array, np.ndarray) and jax.default_backend() == "cpu" and \
+        not any(isinstance(leaf, jax.core.Tracer) for leaf in tree_leaves(pytree))
 
 
 def pytree_sum(pytree, axis=None, keepdims=None, where=None):